@@ -1,19 +1,142 @@
+import os
+import sys
+import tempfile
 import numpy as np
+from joblib import Parallel, delayed
+from sklearn import __version__ as sklearn_version
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import psutil
 import pandas as pd
-from collections import deque
 import logging
 from datetime import datetime
+from operator import itemgetter
+
+try:
+    import treelite
+    import tl2cgen
+except ImportError:  # optional: fall back to scikit-learn prediction
+    treelite = tl2cgen = None
+
+try:
+    from numba import njit
+except ImportError:  # optional: fall back to NumPy thresholding
+    njit = None
+
+try:
+    from river import anomaly as river_anomaly
+    from river import preprocessing as river_preprocessing
+    from river import stats as river_stats
+except ImportError:  # optional: only needed for online=True
+    river_anomaly = None
+
+# Features used for anomaly detection, in model column order
+FEATURE_NAMES = ('cpu_percent', 'memory_percent', 'num_threads',
+                 'num_connections', 'num_files')
+_feature_getter = itemgetter(*FEATURE_NAMES)
+
+# Threshold rules used to explain anomalies, in report order
+REASON_FEATURES = ('cpu_percent', 'memory_percent', 'num_connections',
+                   'num_threads', 'num_files')
+REASON_THRESHOLDS = np.array([80, 80, 50, 100, 100], dtype=np.float32)
+REASON_LABELS = ("High CPU usage", "High memory usage", "Unusual network activity",
+                 "High thread count", "Many open files")
+_reason_getter = itemgetter(*REASON_FEATURES)
+
+# Reason text for every possible threshold bitmask (bit j set = rule j exceeded)
+_REASON_STRINGS = tuple(
+    ", ".join(label for j, label in enumerate(REASON_LABELS) if mask & (1 << j))
+    or "Unusual behavior pattern"
+    for mask in range(1 << len(REASON_LABELS))
+)
+
+if njit is not None:
+    # Compiled serially: the kernel is warmed on a worker thread, and Numba's
+    # parallel thread pool started off the main thread blocks interpreter
+    # shutdown
+    @njit(cache=True)
+    def _reason_mask(feats, thresholds):
+        """Bitmask of exceeded thresholds for each row"""
+        out = np.empty(feats.shape[0], dtype=np.uint8)
+        for i in range(feats.shape[0]):
+            m = 0
+            for j in range(feats.shape[1]):
+                if feats[i, j] > thresholds[j]:
+                    m |= 1 << j
+            out[i] = m
+        return out
+else:
+    def _reason_mask(feats, thresholds):
+        """Bitmask of exceeded thresholds for each row"""
+        bits = (feats > thresholds).astype(np.uint8) << np.arange(feats.shape[1], dtype=np.uint8)
+        return bits.sum(axis=1, dtype=np.uint8)
+
+def _warm_reason_mask():
+    """Trigger the lazy Numba compile of _reason_mask ahead of detection"""
+    _reason_mask(np.zeros((1, len(REASON_LABELS)), dtype=np.float32), REASON_THRESHOLDS)
+
+# scikit-learn parallelizes IsolationForest.predict itself from 1.5 onwards
+SKLEARN_PARALLEL_PREDICT = tuple(int(v) for v in sklearn_version.split('.')[:2]) >= (1, 5)
+
+# Upper bound on processes stored per history snapshot
+MAX_PROCESSES = 4096
+INT16_MAX = np.iinfo(np.int16).max
+
+# Samples the online detector must see before its scores are meaningful
+ONLINE_WINDOW_SIZE = 100
 
 class AdvancedAnomalyDetector:
-    def __init__(self, history_size=100):
+    def __init__(self, history_size=100, max_processes=MAX_PROCESSES, fd_sample_interval=10,
+                 online=False):
         self.history_size = history_size
-        self.process_history = deque(maxlen=history_size)
+        self.max_processes = max_processes
+        
+        # connections()/open_files() are the slowest per-process calls, so known
+        # PIDs only refresh them every fd_sample_interval calls to
+        # collect_process_metrics and reuse cached counts in between; new or
+        # reused PIDs (detected via create_time) are always sampled
+        self._fd_sample_interval = fd_sample_interval
+        self._collect_count = 0
+        self._fd_cache = {}
+        
+        # Columnar ring buffer of process history: one (history_size, max_processes)
+        # array per feature, plus a mask marking which cells hold real samples
+        self.cpu_buf = np.zeros((history_size, max_processes), dtype=np.float32)
+        self.mem_buf = np.zeros((history_size, max_processes), dtype=np.float32)
+        # Count features are small integers, so store them as int16 and only
+        # widen to float32 when the training matrix is built
+        self.thr_buf = np.zeros((history_size, max_processes), dtype=np.int16)
+        self.conn_buf = np.zeros((history_size, max_processes), dtype=np.int16)
+        self.files_buf = np.zeros((history_size, max_processes), dtype=np.int16)
+        self.valid_mask = np.zeros((history_size, max_processes), dtype=bool)
+        self.write_idx = 0
+        self.last_process_count = 0
+        
         self.scaler = StandardScaler()
-        self.model = IsolationForest(contamination=0.1, random_state=42)
+        self.model = IsolationForest(contamination=0.1, n_estimators=100, n_jobs=-1,
+                                     random_state=42)
         self.is_trained = False
+        self._predictor = None
+        self._predictor_dir = None
+        self._mean = None
+        self._scale = None
+        # Reused input buffer for detect_anomalies, so steady-state
+        # detection does not allocate a new feature matrix every call
+        self._scratch = np.empty((max_processes, len(FEATURE_NAMES)), dtype=np.float32)
+        
+        # With online=True (and river installed), an online Half-Space Trees
+        # detector learns from every snapshot and replaces batch IsolationForest
+        # training. Scores above the running 90th percentile are flagged,
+        # matching the IsolationForest contamination of 0.1
+        self.online = None
+        if online and river_anomaly is not None:
+            self.online = (river_preprocessing.MinMaxScaler() |
+                           river_anomaly.HalfSpaceTrees(n_trees=25,
+                                                        window_size=ONLINE_WINDOW_SIZE,
+                                                        seed=42))
+            self._online_threshold = river_stats.Quantile(0.9)
+        self._online_seen = 0
+        self._online_scored = 0
         
         # Initialize logging
         logging.basicConfig(
@@ -21,36 +144,57 @@ class AdvancedAnomalyDetector:
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
+        
+        if online and self.online is None:
+            logging.warning("river is not installed; using IsolationForest instead of "
+                            "the online detector")
     
     def collect_process_metrics(self):
         """Collect detailed metrics for all running processes"""
         process_metrics = []
+        sample_fds = self._collect_count % self._fd_sample_interval == 0
+        self._collect_count += 1
+        fd_cache = {} if sample_fds else self._fd_cache
         
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 
-                                       'num_threads', 'num_fds', 'connections']):
+        for proc in psutil.process_iter(['pid', 'name', 'create_time']):
             try:
                 # Get process info
                 pinfo = proc.info
                 
-                # Get network connections count
-                try:
-                    num_connections = len(proc.connections())
-                except (psutil.AccessDenied, psutil.ZombieProcess):
-                    num_connections = 0
-                
-                # Get number of open files
-                try:
-                    num_files = len(proc.open_files())
-                except (psutil.AccessDenied, psutil.ZombieProcess):
-                    num_files = 0
+                # Fetch all per-process attributes under a single oneshot() so
+                # psutil reads the underlying process stats only once
+                with proc.oneshot():
+                    stats = proc.as_dict(['cpu_percent', 'memory_percent',
+                                          'num_threads', 'num_fds'], ad_value=None)
+                    
+                    # Reuse cached counts only for processes sampled on an earlier
+                    # call; create_time guards against a reused PID
+                    cached_fds = None if sample_fds else fd_cache.get(pinfo['pid'])
+                    if cached_fds is None or cached_fds[0] != pinfo['create_time']:
+                        # Get network connections count
+                        try:
+                            num_connections = len(proc.connections())
+                        except (psutil.AccessDenied, psutil.ZombieProcess):
+                            num_connections = 0
+                        
+                        # Get number of open files
+                        try:
+                            num_files = len(proc.open_files())
+                        except (psutil.AccessDenied, psutil.ZombieProcess):
+                            num_files = 0
+                        
+                        fd_cache[pinfo['pid']] = (pinfo['create_time'], num_connections,
+                                                  num_files)
+                    else:
+                        _, num_connections, num_files = cached_fds
                 
                 metrics = {
                     'pid': pinfo['pid'],
                     'name': pinfo['name'],
-                    'cpu_percent': pinfo['cpu_percent'] or 0,
-                    'memory_percent': pinfo['memory_percent'] or 0,
-                    'num_threads': pinfo['num_threads'] or 0,
-                    'num_fds': pinfo['num_fds'] or 0,
+                    'cpu_percent': stats['cpu_percent'] or 0,
+                    'memory_percent': stats['memory_percent'] or 0,
+                    'num_threads': stats['num_threads'] or 0,
+                    'num_fds': stats['num_fds'] or 0,
                     'num_connections': num_connections,
                     'num_files': num_files
                 }
@@ -61,36 +205,76 @@ class AdvancedAnomalyDetector:
                 logging.warning(f"Error collecting metrics for process: {e}")
                 continue
         
+        # Replacing the cache on sampled rounds also drops exited PIDs
+        self._fd_cache = fd_cache
         return process_metrics
     
     def update_history(self):
-        """Update process history with current metrics"""
+        """Update process history with current metrics and return them"""
         current_metrics = self.collect_process_metrics()
-        self.process_history.append(current_metrics)
-        logging.info(f"Updated process history. Current size: {len(self.process_history)}")
+        if len(current_metrics) > self.max_processes:
+            logging.warning(f"Process count {len(current_metrics)} exceeds history capacity "
+                            f"{self.max_processes}; extra processes not recorded")
+        
+        # Overwrite the oldest snapshot slot column by column
+        n = min(len(current_metrics), self.max_processes)
+        slot = self.write_idx % self.history_size
+        features = np.array([_feature_getter(proc) for proc in current_metrics[:n]],
+                            dtype=np.float32).reshape(n, len(FEATURE_NAMES))
+        for col, buf in enumerate(self._feature_buffers()):
+            if buf.dtype == np.int16:
+                buf[slot, :n] = np.clip(features[:, col], 0, INT16_MAX)
+            else:
+                buf[slot, :n] = features[:, col]
+            buf[slot, n:] = 0
+        self.valid_mask[slot, :n] = True
+        self.valid_mask[slot, n:] = False
+        
+        if self.online is not None:
+            for row in features:
+                x = dict(zip(FEATURE_NAMES, row.tolist()))
+                # Once the first window is complete, seed the score threshold
+                # with each sample's score before it is learned
+                if self._online_seen >= ONLINE_WINDOW_SIZE:
+                    self._online_threshold.update(self.online.score_one(x))
+                    self._online_scored += 1
+                self.online.learn_one(x)
+                self._online_seen += 1
+        
+        self.write_idx += 1
+        self.last_process_count = len(current_metrics)
+        logging.info(f"Updated process history. Current size: "
+                     f"{min(self.write_idx, self.history_size)}")
+        return current_metrics
+    
+    def _feature_buffers(self):
+        """Return the history buffers in FEATURE_NAMES order"""
+        return (self.cpu_buf, self.mem_buf, self.thr_buf, self.conn_buf, self.files_buf)
     
     def prepare_training_data(self):
         """Prepare data for anomaly detection model"""
-        if not self.process_history:
+        if self.write_idx == 0:
             return None
         
-        # Aggregate metrics per process
-        all_data = []
-        for metrics in self.process_history:
-            for proc in metrics:
-                feature_vector = [
-                    proc['cpu_percent'],
-                    proc['memory_percent'],
-                    proc['num_threads'],
-                    proc['num_connections'],
-                    proc['num_files']
-                ]
-                all_data.append(feature_vector)
-        
-        return np.array(all_data)
+        # Stack the feature columns (widening counts to float32) and keep
+        # only the filled cells
+        stacked = np.stack(self._feature_buffers(), axis=-1).astype(np.float32, copy=False)
+        return stacked.reshape(-1, len(FEATURE_NAMES))[self.valid_mask.ravel()]
     
     def train_model(self):
         """Train the anomaly detection model"""
+        if self.online is not None:
+            # The online detector learns in update_history; it only needs to
+            # have seen a full window of samples plus enough scores to seed
+            # its threshold
+            if self._online_scored < ONLINE_WINDOW_SIZE:
+                logging.warning("Insufficient data for training")
+                return False
+            _warm_reason_mask()
+            self.is_trained = True
+            logging.info("Online anomaly detection model ready")
+            return True
+        
         data = self.prepare_training_data()
         if data is None or len(data) < self.history_size:
             logging.warning("Insufficient data for training")
@@ -99,9 +283,14 @@ class AdvancedAnomalyDetector:
         try:
             # Scale the data
             scaled_data = self.scaler.fit_transform(data)
+            self._mean = self.scaler.mean_.astype(np.float32)
+            self._scale = self.scaler.scale_.astype(np.float32)
+            assert scaled_data.dtype == np.float32, "training data must be float32"
             
             # Train the model
             self.model.fit(scaled_data)
+            self._predictor = self.compile_predictor()
+            _warm_reason_mask()
             self.is_trained = True
             logging.info("Successfully trained anomaly detection model")
             return True
@@ -117,28 +306,27 @@ class AdvancedAnomalyDetector:
             return []
         
         try:
-            # Prepare current process data
-            current_data = []
-            for proc in processes:
-                feature_vector = [
-                    proc['cpu_percent'],
-                    proc['memory_percent'],
-                    proc['num_threads'],
-                    proc['num_connections'],
-                    proc['num_files']
-                ]
-                current_data.append(feature_vector)
+            # Prepare current process data in the scratch buffer
+            n = len(processes)
+            if n <= len(self._scratch):
+                current_data = self._scratch[:n]
+            else:
+                current_data = np.empty((n, len(FEATURE_NAMES)), dtype=np.float32)
+            for i, proc in enumerate(processes):
+                current_data[i] = _feature_getter(proc)
             
-            # Scale and predict
-            scaled_data = self.scaler.transform(current_data)
-            predictions = self.model.predict(scaled_data)
+            if self.online is not None:
+                predictions = self.predict_online(current_data)
+            else:
+                # Scale in place with the cached training statistics and predict
+                np.subtract(current_data, self._mean, out=current_data)
+                np.divide(current_data, self._scale, out=current_data)
+                predictions = self.predict(current_data)
             
             # Find anomalous processes (where prediction == -1)
-            anomalies = []
-            for i, pred in enumerate(predictions):
-                if pred == -1:
-                    processes[i]['anomaly_reason'] = self.get_anomaly_reason(processes[i])
-                    anomalies.append(processes[i])
+            anomalies = [processes[i] for i in np.flatnonzero(predictions == -1)]
+            for proc, reason in zip(anomalies, self.get_anomaly_reasons(anomalies)):
+                proc['anomaly_reason'] = reason
             
             logging.info(f"Detected {len(anomalies)} anomalous processes")
             return anomalies
@@ -147,28 +335,80 @@ class AdvancedAnomalyDetector:
             logging.error(f"Error detecting anomalies: {e}")
             return []
     
+    def predict_online(self, current_data):
+        """Score rows with the online detector; returns -1 for anomalies, 1 otherwise"""
+        scores = np.array([self.online.score_one(dict(zip(FEATURE_NAMES, row.tolist())))
+                           for row in current_data])
+        # Compare against the threshold as it stood before this batch, then
+        # fold the batch's scores into it
+        threshold = self._online_threshold.get()
+        for score in scores:
+            self._online_threshold.update(score)
+        return np.where(scores > threshold, -1, 1)
+    
+    def compile_predictor(self):
+        """Compile the fitted model to a native treelite library, if available"""
+        if treelite is None:
+            return None
+        
+        try:
+            # The library lives in a temporary directory owned by the detector,
+            # removed when it is replaced or garbage collected
+            if self._predictor_dir is not None:
+                self._predictor_dir.cleanup()
+            self._predictor_dir = tempfile.TemporaryDirectory(prefix='iso_predictor_')
+            ext = '.dylib' if sys.platform == 'darwin' else '.so'
+            libpath = os.path.join(self._predictor_dir.name, 'iso_predictor' + ext)
+            tl_model = treelite.sklearn.import_model(self.model)
+            tl2cgen.export_lib(model=tl_model, toolchain='gcc', libpath=libpath,
+                               params={'parallel_comp': os.cpu_count() or 1})
+            logging.info(f"Compiled anomaly detection model to {libpath}")
+            return tl2cgen.Predictor(libpath)
+            
+        except Exception as e:
+            logging.warning(f"Could not compile model, using scikit-learn prediction: {e}")
+            return None
+    
+    def predict(self, scaled_data):
+        """Run model prediction across all CPU cores"""
+        if self._predictor is not None:
+            # The compiled forest outputs the negated anomaly score; flag rows
+            # that fall below the model's fitted offset, as predict() does
+            scores = self._predictor.predict(tl2cgen.DMatrix(scaled_data)).ravel()
+            return np.where(scores > -self.model.offset_, -1, 1)
+        
+        # Threshold the decision function directly; negative scores are the
+        # rows IsolationForest.predict labels as outliers
+        if SKLEARN_PARALLEL_PREDICT:
+            scores = self.model.decision_function(scaled_data)
+        else:
+            # Older scikit-learn scores on a single core; split the rows and
+            # score chunks on threads (tree traversal releases the GIL)
+            n_chunks = max(1, min(os.cpu_count() or 1, len(scaled_data)))
+            chunks = np.array_split(scaled_data, n_chunks)
+            scores = np.concatenate(Parallel(n_jobs=-1, backend='threading')(
+                delayed(self.model.decision_function)(chunk) for chunk in chunks
+            ))
+        return np.where(scores < 0, -1, 1)
+    
     def get_anomaly_reason(self, process):
         """Determine the reason for anomaly"""
-        reasons = []
-        
-        if process['cpu_percent'] > 80:
-            reasons.append("High CPU usage")
-        if process['memory_percent'] > 80:
-            reasons.append("High memory usage")
-        if process['num_connections'] > 50:
-            reasons.append("Unusual network activity")
-        if process['num_threads'] > 100:
-            reasons.append("High thread count")
-        if process['num_files'] > 100:
-            reasons.append("Many open files")
-        
-        return ", ".join(reasons) if reasons else "Unusual behavior pattern"
+        return self.get_anomaly_reasons([process])[0]
+    
+    def get_anomaly_reasons(self, processes):
+        """Determine the reasons for a batch of anomalies in one vectorized pass"""
+        if not processes:
+            return []
+        
+        feats = np.array([_reason_getter(proc) for proc in processes], dtype=np.float32)
+        masks = _reason_mask(feats, REASON_THRESHOLDS)
+        return [_REASON_STRINGS[mask] for mask in masks]
     
     def generate_report(self, anomalies):
         """Generate a detailed report of anomalies"""
         report = {
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'total_processes': len(self.process_history[-1]) if self.process_history else 0,
+            'total_processes': self.last_process_count,
             'anomaly_count': len(anomalies),
             'anomalies': []
         }
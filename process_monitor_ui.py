@@ -1,17 +1,139 @@
+import re
 import sys
 import time
+import numpy as np
 import psutil
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                            QTableWidget, QTableWidgetItem, QPushButton, QLabel,
-                            QHeaderView, QHBoxLayout, QMessageBox)
-from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QColor
+                            QTableView, QPushButton, QLabel,
+                            QHeaderView, QHBoxLayout, QMessageBox,
+                            QStyledItemDelegate)
+from PyQt5.QtCore import (QTimer, Qt, QAbstractTableModel, QModelIndex,
+                          QSortFilterProxyModel, QObject, QRunnable, QThreadPool,
+                          pyqtSignal)
+from PyQt5.QtGui import QColor, QBrush
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from advanced_anomaly_detector import AdvancedAnomalyDetector
 import json
 
+try:
+    import orjson
+except ImportError:  # optional: fall back to the standard library encoder
+    orjson = None
+
+# Number of samples shown in the resource graphs
+GRAPH_POINTS = 50
+
+# Model role exposing a row's PID to the anomaly delegate
+PID_ROLE = Qt.UserRole + 1
+
+class SamplerSignals(QObject):
+    """Signals emitted by ProcessSampler back on the GUI thread"""
+    processes_ready = pyqtSignal(list)
+    error = pyqtSignal(str)
+
+class ProcessSampler(QRunnable):
+    """Runs a process sampling function on a QThreadPool worker thread"""
+    def __init__(self, sample_fn):
+        super().__init__()
+        self.sample_fn = sample_fn
+        self.signals = SamplerSignals()
+    
+    def run(self):
+        try:
+            self.signals.processes_ready.emit(self.sample_fn())
+        except Exception as e:
+            self.signals.error.emit(str(e))
+
+class ReportWriterSignals(QObject):
+    """Signals emitted by ReportWriter back on the GUI thread"""
+    finished = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+class ReportWriter(QRunnable):
+    """Writes a serialized anomaly report to disk on a worker thread"""
+    def __init__(self, report_file, payload):
+        super().__init__()
+        self.report_file = report_file
+        self.payload = payload
+        self.signals = ReportWriterSignals()
+    
+    def run(self):
+        try:
+            with open(self.report_file, 'wb') as f:
+                f.write(self.payload)
+        except OSError as e:
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.finished.emit(self.report_file)
+
+def serialize_report(report):
+    """Serialize a report to indented JSON bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(report, indent=2).encode('utf-8')
+
+class ProcessTableModel(QAbstractTableModel):
+    """Table model backed by the list of process dicts from update_data"""
+    HEADERS = ["PID", "Name", "Username", "CPU %", "Memory (MB)", "Status", "Created"]
+    KEYS = ['pid', 'name', 'username', 'cpu', 'memory', 'status', 'created']
+    
+    SUSPICIOUS_COLOR = QColor(255, 200, 200)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        
+        process = self._rows[index.row()]
+        value = process[self.KEYS[index.column()]]
+        
+        if role == Qt.DisplayRole:
+            if isinstance(value, float):
+                return f"{value:.1f}"
+            return str(value) if value is not None else ""
+        if role == Qt.UserRole:
+            # Raw value used for sorting, so numeric columns sort numerically
+            return value if value is not None else ""
+        if role == PID_ROLE:
+            return process['pid']
+        if role == Qt.BackgroundRole and process['suspicious']:
+            return self.SUSPICIOUS_COLOR
+        return None
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+    
+    def set_processes(self, processes):
+        self.beginResetModel()
+        self._rows = processes
+        self.endResetModel()
+
+class AnomalyDelegate(QStyledItemDelegate):
+    """Paints rows whose PID is in anomaly_pids with the anomaly background"""
+    ANOMALY_COLOR = QColor(255, 87, 34, 100)  # Semi-transparent red
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.anomaly_pids = set()
+    
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        if index.data(PID_ROLE) in self.anomaly_pids:
+            option.backgroundBrush = QBrush(self.ANOMALY_COLOR)
+
 class ProcessMonitorUI(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -26,6 +148,7 @@ class ProcessMonitorUI(QMainWindow):
             "netcat", "wireshark", "nmap", "john", "hashcat", "hydra",
             "tcpdump", "aircrack", "ettercap", "burpsuite"
         ]
+        self._susp_re = re.compile('|'.join(map(re.escape, self.suspicious_patterns)))
         
         # Create main widget and layout
         main_widget = QWidget()
@@ -39,19 +162,23 @@ class ProcessMonitorUI(QMainWindow):
         header_layout.addWidget(self.system_info_label)
         layout.addLayout(header_layout)
         
-        # Create process table
-        self.process_table = QTableWidget()
-        self.process_table.setColumnCount(7)
-        self.process_table.setHorizontalHeaderLabels([
-            "PID", "Name", "Username", "CPU %", "Memory (MB)", "Status", "Created"
-        ])
+        # Create process table; rows are served lazily from the model and
+        # sorted on raw values through a proxy
+        self.process_model = ProcessTableModel(self)
+        self.process_proxy = QSortFilterProxyModel(self)
+        self.process_proxy.setSourceModel(self.process_model)
+        self.process_proxy.setSortRole(Qt.UserRole)
+        self.process_table = QTableView()
+        self.process_table.setModel(self.process_proxy)
+        self.anomaly_delegate = AnomalyDelegate(self.process_table)
+        self.process_table.setItemDelegate(self.anomaly_delegate)
         
         # Set table properties
         self.process_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
         self.process_table.setAlternatingRowColors(True)
         self.process_table.setSortingEnabled(True)
         self.process_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 gridline-color: #d3d3d3;
                 background-color: white;
                 alternate-background-color: #f6f6f6;
@@ -69,6 +196,22 @@ class ProcessMonitorUI(QMainWindow):
         self.figure, (self.cpu_ax, self.mem_ax) = plt.subplots(2, 1, figsize=(8, 6))
         self.canvas = FigureCanvas(self.figure)
         
+        # Create the plot lines once; refreshes only update their data
+        self._cpu_line, = self.cpu_ax.plot([], [], 'b-', label='CPU Usage')
+        self.cpu_ax.set_ylabel('CPU Usage (%)')
+        self.cpu_ax.set_title('CPU Usage Over Time')
+        self.cpu_ax.grid(True)
+        self.cpu_ax.legend()
+        
+        self._mem_line, = self.mem_ax.plot([], [], 'r-', label='Memory Usage')
+        self.mem_ax.set_xlabel('Time (s)')
+        self.mem_ax.set_ylabel('Memory Usage (%)')
+        self.mem_ax.set_title('Memory Usage Over Time')
+        self.mem_ax.grid(True)
+        self.mem_ax.legend()
+        
+        self.figure.tight_layout()
+        
         # Control panel
         control_layout = QHBoxLayout()
         
@@ -136,33 +279,74 @@ class ProcessMonitorUI(QMainWindow):
         layout.addWidget(self.status_label)
         
         # Initialize data storage for graphs
-        self.cpu_history = []
-        self.mem_history = []
-        self.time_points = []
+        # Fixed-size ring buffers; self._n counts samples written so far
+        self._cpu_buf = np.zeros(GRAPH_POINTS, dtype=np.float32)
+        self._mem_buf = np.zeros(GRAPH_POINTS, dtype=np.float32)
+        self._t_buf = np.zeros(GRAPH_POINTS, dtype=np.float32)
+        self._n = 0
         self.start_time = time.time()
         
         # Set up timer for automatic updates
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_data)
         
+        # Process sampling runs on the thread pool; these flags keep the timer
+        # and repeated clicks from stacking workers
+        self._sampling_in_flight = False
+        self._detection_in_flight = False
+        
+        # Per-process fields that are stable until the process exits or execs,
+        # keyed by PID: pid -> (create_time, name, created, username, suspicious)
+        self._proc_cache = {}
+        
         # Initial update
         self.update_data()
 
     def check_anomalies(self):
+        if self._detection_in_flight:
+            return
+        
+        # Update anomaly detector history and train off the GUI thread
+        self._detection_in_flight = True
+        if self.anomaly_detector.is_trained:
+            self.status_label.setText("Collecting process metrics...")
+        else:
+            self.status_label.setText("Training anomaly detection model...")
+        self.status_label.setStyleSheet("color: #2196F3;")
+        worker = ProcessSampler(self.sample_and_train)
+        worker.signals.processes_ready.connect(self.on_metrics_ready)
+        worker.signals.error.connect(self.on_detection_error)
+        QThreadPool.globalInstance().start(worker)
+    
+    def sample_and_train(self):
+        """Record a history snapshot and train if needed; runs on a worker thread"""
+        current_metrics = self.anomaly_detector.update_history()
+        if not self.anomaly_detector.is_trained:
+            self.anomaly_detector.train_model()
+        return current_metrics
+    
+    def on_detection_error(self, message):
+        self._detection_in_flight = False
+        self.status_label.setText(f"Error detecting anomalies: {message}")
+        self.status_label.setStyleSheet("color: #F44336;")
+    
+    def on_report_saved(self, anomaly_count, report_file):
+        self.status_label.setText(
+            f"Found {anomaly_count} anomalous processes. Report saved to {report_file}"
+        )
+        self.status_label.setStyleSheet("color: #4CAF50;")
+    
+    def on_report_error(self, message):
+        self.status_label.setText(f"Error saving report: {message}")
+        self.status_label.setStyleSheet("color: #F44336;")
+    
+    def on_metrics_ready(self, current_metrics):
+        self._detection_in_flight = False
         try:
-            # Update anomaly detector history
-            self.anomaly_detector.update_history()
-            
-            # Train model if needed
+            # Training ran on the worker; it fails until there is enough data
             if not self.anomaly_detector.is_trained:
-                self.status_label.setText("Training anomaly detection model...")
-                self.status_label.setStyleSheet("color: #2196F3;")
-                if not self.anomaly_detector.train_model():
-                    self.status_label.setText("Need more data to train model")
-                    return
-            
-            # Get current process metrics
-            current_metrics = self.anomaly_detector.collect_process_metrics()
+                self.status_label.setText("Need more data to train model")
+                return
             
             # Detect anomalies
             anomalies = self.anomaly_detector.detect_anomalies(current_metrics)
@@ -170,34 +354,30 @@ class ProcessMonitorUI(QMainWindow):
             # Generate report
             report = self.anomaly_detector.generate_report(anomalies)
             
-            # Save report
+            # Save report in the background
             report_file = f'anomaly_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-            with open(report_file, 'w') as f:
-                json.dump(report, f, indent=2)
+            writer = ReportWriter(report_file, serialize_report(report))
+            writer.signals.finished.connect(
+                lambda path, count=len(anomalies): self.on_report_saved(count, path)
+            )
+            writer.signals.error.connect(self.on_report_error)
+            QThreadPool.globalInstance().start(writer)
             
-            # Update UI
+            # Update UI; success is reported once the writer finishes
             self.status_label.setText(
-                f"Found {len(anomalies)} anomalous processes. Report saved to {report_file}"
+                f"Found {len(anomalies)} anomalous processes. Saving report to {report_file}..."
             )
-            self.status_label.setStyleSheet("color: #4CAF50;")
+            self.status_label.setStyleSheet("color: #2196F3;")
             
             # Highlight anomalous processes in the table
             self.highlight_anomalies(anomalies)
             
         except Exception as e:
-            self.status_label.setText(f"Error detecting anomalies: {str(e)}")
-            self.status_label.setStyleSheet("color: #F44336;")
+            self.on_detection_error(str(e))
 
     def highlight_anomalies(self, anomalies):
-        anomaly_pids = {proc['pid'] for proc in anomalies}
-        
-        for row in range(self.process_table.rowCount()):
-            pid_item = self.process_table.item(row, 0)  # Assuming PID is in first column
-            if pid_item and int(pid_item.text()) in anomaly_pids:
-                for col in range(self.process_table.columnCount()):
-                    item = self.process_table.item(row, col)
-                    if item:
-                        item.setBackground(QColor(255, 87, 34, 100))  # Semi-transparent red
+        self.anomaly_delegate.anomaly_pids = {proc['pid'] for proc in anomalies}
+        self.process_table.viewport().update()
     
     def toggle_auto_refresh(self, checked):
         if checked:
@@ -208,13 +388,9 @@ class ProcessMonitorUI(QMainWindow):
             self.refresh_button.setEnabled(True)
     
     def is_suspicious(self, name, cmdline):
-        name = name.lower()
-        if cmdline:
-            cmdline = ' '.join(cmdline).lower()
-        else:
-            cmdline = ''
-            
-        return any(pattern in name or pattern in cmdline for pattern in self.suspicious_patterns)
+        # Match all patterns in a single pass of the precompiled regex
+        return bool(self._susp_re.search(name.lower()) or
+                    (cmdline and self._susp_re.search(' '.join(cmdline).lower())))
     
     def update_data(self):
         try:
@@ -227,96 +403,102 @@ class ProcessMonitorUI(QMainWindow):
                 f"Memory Percent: {memory.percent}%"
             )
             
-            # Update process table
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 
-                                          'memory_percent', 'status', 'create_time', 'cmdline']):
-                try:
-                    pinfo = proc.info
-                    created = datetime.fromtimestamp(pinfo['create_time']).strftime('%Y-%m-%d %H:%M:%S')
-                    memory_mb = proc.memory_info().rss / 1024 / 1024  # Convert to MB
-                    
-                    processes.append({
-                        'pid': pinfo['pid'],
-                        'name': pinfo['name'],
-                        'username': pinfo['username'],
-                        'cpu': pinfo['cpu_percent'],
-                        'memory': memory_mb,
-                        'status': pinfo['status'],
-                        'created': created,
-                        'suspicious': self.is_suspicious(pinfo['name'], pinfo.get('cmdline', []))
-                    })
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    continue
-            
-            self.update_process_table(processes)
             self.update_resource_graphs(cpu_percent, memory.percent)
             
+            # Sample processes on the thread pool; the table updates when done
+            if not self._sampling_in_flight:
+                self._sampling_in_flight = True
+                worker = ProcessSampler(self.collect_processes)
+                worker.signals.processes_ready.connect(self.on_processes_ready)
+                worker.signals.error.connect(self.on_sampling_error)
+                QThreadPool.globalInstance().start(worker)
+            
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error updating data: {str(e)}")
     
+    def collect_processes(self):
+        """Collect process table rows; runs on a worker thread"""
+        processes = []
+        proc_cache = {}
+        # memory_info is requested alongside the other attributes so psutil
+        # fetches everything in a single oneshot() pass per process
+        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info',
+                                      'status', 'create_time']):
+            try:
+                pinfo = proc.info
+                
+                # Owner and start time never change for a given process, and the
+                # name only changes on exec, so look up the rest (and re-check
+                # suspicious patterns) only for a new (pid, create_time, name)
+                cached = self._proc_cache.get(pinfo['pid'])
+                if cached is None or cached[:2] != (pinfo['create_time'], pinfo['name']):
+                    extra = proc.as_dict(['username', 'cmdline'], ad_value=None)
+                    created = datetime.fromtimestamp(pinfo['create_time']).strftime('%Y-%m-%d %H:%M:%S')
+                    cached = (pinfo['create_time'], pinfo['name'], created, extra['username'],
+                              self.is_suspicious(pinfo['name'] or '', extra['cmdline']))
+                proc_cache[pinfo['pid']] = cached
+                _, name, created, username, suspicious = cached
+                
+                # memory_info is None when access is denied; leave the cell blank
+                # rather than reporting 0 MB
+                mem_info = pinfo['memory_info']
+                memory_mb = mem_info.rss / 1024 / 1024 if mem_info else None  # Convert to MB
+                
+                processes.append({
+                    'pid': pinfo['pid'],
+                    'name': name,
+                    'username': username,
+                    'cpu': pinfo['cpu_percent'],
+                    'memory': memory_mb,
+                    'status': pinfo['status'],
+                    'created': created,
+                    'suspicious': suspicious
+                })
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        
+        # Keep only processes that are still running
+        self._proc_cache = proc_cache
+        return processes
+    
+    def on_processes_ready(self, processes):
+        self._sampling_in_flight = False
+        self.update_process_table(processes)
+    
+    def on_sampling_error(self, message):
+        self._sampling_in_flight = False
+        QMessageBox.critical(self, "Error", f"Error updating data: {message}")
+    
     def update_process_table(self, processes):
-        self.process_table.setSortingEnabled(False)
-        self.process_table.setRowCount(len(processes))
-        
-        for row, process in enumerate(processes):
-            items = [
-                QTableWidgetItem(str(process['pid'])),
-                QTableWidgetItem(process['name']),
-                QTableWidgetItem(process['username']),
-                QTableWidgetItem(f"{process['cpu']:.1f}"),
-                QTableWidgetItem(f"{process['memory']:.1f}"),
-                QTableWidgetItem(process['status']),
-                QTableWidgetItem(process['created'])
-            ]
-            
-            # Set items as non-editable
-            for item in items:
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-            
-            # Apply color if process is suspicious
-            if process['suspicious']:
-                for item in items:
-                    item.setBackground(QColor(255, 200, 200))
-            
-            # Add items to row
-            for col, item in enumerate(items):
-                self.process_table.setItem(row, col, item)
-        
-        self.process_table.setSortingEnabled(True)
+        self.process_model.set_processes(processes)
+    
+    def _graph_view(self, buf):
+        """Return the filled part of a graph ring buffer in time order"""
+        if self._n <= GRAPH_POINTS:
+            return buf[:self._n]
+        return np.roll(buf, -(self._n % GRAPH_POINTS))
     
     def update_resource_graphs(self, cpu_percent, mem_percent):
         current_time = time.time() - self.start_time
         
-        self.time_points.append(current_time)
-        self.cpu_history.append(cpu_percent)
-        self.mem_history.append(mem_percent)
+        # Overwrite the oldest sample in the ring buffers
+        idx = self._n % GRAPH_POINTS
+        self._t_buf[idx] = current_time
+        self._cpu_buf[idx] = cpu_percent
+        self._mem_buf[idx] = mem_percent
+        self._n += 1
         
-        # Keep only last 50 data points
-        if len(self.time_points) > 50:
-            self.time_points.pop(0)
-            self.cpu_history.pop(0)
-            self.mem_history.pop(0)
+        # Update graph data in place, oldest sample first
+        time_points = self._graph_view(self._t_buf)
+        self._cpu_line.set_data(time_points, self._graph_view(self._cpu_buf))
+        self.cpu_ax.relim()
+        self.cpu_ax.autoscale_view()
         
-        # Update CPU graph
-        self.cpu_ax.clear()
-        self.cpu_ax.plot(self.time_points, self.cpu_history, 'b-', label='CPU Usage')
-        self.cpu_ax.set_ylabel('CPU Usage (%)')
-        self.cpu_ax.set_title('CPU Usage Over Time')
-        self.cpu_ax.grid(True)
-        self.cpu_ax.legend()
+        self._mem_line.set_data(time_points, self._graph_view(self._mem_buf))
+        self.mem_ax.relim()
+        self.mem_ax.autoscale_view()
         
-        # Update Memory graph
-        self.mem_ax.clear()
-        self.mem_ax.plot(self.time_points, self.mem_history, 'r-', label='Memory Usage')
-        self.mem_ax.set_xlabel('Time (s)')
-        self.mem_ax.set_ylabel('Memory Usage (%)')
-        self.mem_ax.set_title('Memory Usage Over Time')
-        self.mem_ax.grid(True)
-        self.mem_ax.legend()
-        
-        self.figure.tight_layout()
-        self.canvas.draw()
+        self.canvas.draw_idle()
 
 def check_anomalies(self):
     try: